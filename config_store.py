@@ -0,0 +1,532 @@
+#!/usr/bin/env python3
+# Content-addressed configuration store for mmWave pod configs
+# Keeps gzip-compressed, deduplicated YAML blobs plus a small JSON index
+# (pod name -> revisions, hash, validation/flash status) so the tool no
+# longer has to drop a new timestamped file next to the script on every save.
+import sys
+import os
+import re
+import gzip
+import json
+import time
+import hashlib
+import difflib
+import datetime
+from contextlib import contextmanager
+
+# The index lock is an OS file lock, released automatically if a process dies
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+INDEX_VERSION = 1
+
+# How long to wait for another process holding the index lock (seconds)
+LOCK_TIMEOUT = 10
+
+# ESPHome node names: lowercase letters, digits, hyphens and underscores
+POD_NAME_PATTERN = re.compile(r'^[a-z0-9_-]+$')
+
+# Names whose working copy would overwrite a tracked file next to the script
+RESERVED_POD_NAMES = {"example-config"}
+
+# Matches the legacy "{name}_{YYYYmmdd_HHMMSS}.yaml" files written by older versions of the tool
+LEGACY_FILE_PATTERN = re.compile(r'^(?P<name>.+)_(?P<stamp>\d{8}_\d{6})\.yaml$')
+
+
+class ConfigStore:
+    """Deduplicated, indexed store of per-pod ESPHome configurations
+
+    Layout under the store directory:
+        index.json               pod name -> head hash and revision list
+        objects/ab/abcdef...gz   compressed config blobs, keyed by SHA-256
+
+    ESPHome needs a real file to validate or flash, so each pod has exactly
+    one working copy (<working_dir>/<name>.yaml) that is rewritten on
+    checkout. The working directory defaults to the store's "pods" folder;
+    the configuration tool points it at the script directory so relative
+    paths such as `external_components: source: ../` keep resolving the same
+    way. Disk usage grows with the number of pods and distinct configs, not
+    with the number of saves.
+
+    The GUI, the command line and the flash pipeline may all have the store
+    open at once, so the index is re-read before every lookup and every
+    change is a locked read-modify-write of index.json (see transaction()).
+    """
+
+    def __init__(self, store_dir, working_dir=None):
+        self.store_dir = os.path.abspath(store_dir)
+        self.objects_dir = os.path.join(self.store_dir, "objects")
+        self.working_dir = os.path.abspath(working_dir or os.path.join(self.store_dir, "pods"))
+        self.index_path = os.path.join(self.store_dir, "index.json")
+        self.lock_path = os.path.join(self.store_dir, "index.lock")
+        self.lock_fd = None
+        self.lock_depth = 0
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.working_dir, exist_ok=True)
+        self.index = self.load_index()
+
+    # ------------------------------------------------------------------
+    # Index handling
+    # ------------------------------------------------------------------
+    def load_index(self):
+        """Load the index from disk, starting a fresh one if it is missing"""
+        if not os.path.exists(self.index_path):
+            return {"version": INDEX_VERSION, "pods": {}}
+        with open(self.index_path, 'r') as f:
+            index = json.load(f)
+        index.setdefault("version", INDEX_VERSION)
+        index.setdefault("pods", {})
+        return index
+
+    def save_index(self):
+        """Write the index atomically so a crash never leaves it half written"""
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.index_path)
+
+    def read_index(self):
+        """Return the index, re-read from disk unless a change is in progress"""
+        if not self.lock_depth:
+            self.index = self.load_index()
+        return self.index
+
+    def acquire_lock(self):
+        """Lock index.lock, waiting for any other process that holds it
+
+        The lock file itself is never removed; the OS drops the lock when
+        the holder closes it or exits, so there is no stale lock to clean up.
+        """
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT)
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                self.lock_fd = fd
+                return
+            except OSError:
+                if time.monotonic() >= deadline:
+                    os.close(fd)
+                    raise RuntimeError(f"Config store is locked by another process ({self.lock_path})")
+                time.sleep(0.05)
+
+    def release_lock(self):
+        fd, self.lock_fd = self.lock_fd, None
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def transaction(self):
+        """Lock the store, re-read the index and write it back on success
+
+        Nested transactions join the outermost one. If the body raises, the
+        index is not written and the next read picks up the on-disk state.
+        """
+        if self.lock_depth:
+            self.lock_depth += 1
+            try:
+                yield self.index
+            finally:
+                self.lock_depth -= 1
+            return
+
+        self.acquire_lock()
+        try:
+            self.lock_depth = 1
+            self.index = self.load_index()
+            yield self.index
+            self.save_index()
+        finally:
+            self.lock_depth = 0
+            self.release_lock()
+
+    # ------------------------------------------------------------------
+    # Object storage
+    # ------------------------------------------------------------------
+    @staticmethod
+    def hash_text(text):
+        """Return the content hash used as the object key"""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def object_path(self, config_hash):
+        return os.path.join(self.objects_dir, config_hash[:2], f"{config_hash}.yaml.gz")
+
+    def write_object(self, text):
+        """Store text as a compressed blob and return its hash (no-op if already stored)"""
+        config_hash = self.hash_text(text)
+        path = self.object_path(config_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.tmp"
+            with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(temp_path, path)
+        return config_hash
+
+    def read_object(self, config_hash):
+        """Return the config text stored under config_hash"""
+        path = self.object_path(config_hash)
+        if not os.path.exists(path):
+            raise KeyError(f"Unknown config object: {config_hash}")
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return f.read()
+
+    # ------------------------------------------------------------------
+    # Revisions
+    # ------------------------------------------------------------------
+    @staticmethod
+    def check_name(name):
+        """Raise ValueError unless name is a valid ESPHome node name for a pod"""
+        if not POD_NAME_PATTERN.match(name or ""):
+            raise ValueError(f"Invalid pod name '{name}': use lowercase letters, digits, '-' and '_' only")
+        if name in RESERVED_POD_NAMES:
+            raise ValueError(f"Pod name '{name}' is reserved")
+
+    def pods(self):
+        """Return the names of all pods in the store"""
+        return sorted(self.read_index()["pods"])
+
+    def revisions(self, name):
+        """Return the revision list for a pod, oldest first"""
+        return self.read_index()["pods"].get(name, {}).get("revisions", [])
+
+    def head(self, name):
+        """Return the current revision entry for a pod, or None"""
+        revisions = self.revisions(name)
+        return revisions[-1] if revisions else None
+
+    def resolve(self, name, ref=None):
+        """Resolve a revision reference to a revision entry
+
+        ref may be None (head), a revision number, a negative offset from
+        head (-1 is the previous revision) or a hash prefix. A string of
+        digits is tried as a revision number first, then as a hash prefix.
+        """
+        revisions = self.revisions(name)
+        if not revisions:
+            raise KeyError(f"No revisions stored for pod '{name}'")
+        if ref is None:
+            return revisions[-1]
+        if isinstance(ref, str) and re.match(r'^-\d+$', ref):
+            ref = int(ref)
+        if isinstance(ref, int) and ref < 0:
+            if -ref >= len(revisions):
+                raise KeyError(f"Pod '{name}' only has {len(revisions)} revisions")
+            return revisions[ref - 1]
+        if isinstance(ref, int) or ref.isdigit():
+            for revision in revisions:
+                if revision["rev"] == int(ref):
+                    return revision
+            if isinstance(ref, int):
+                raise KeyError(f"Pod '{name}' has no revision {ref}")
+        matches = [r for r in revisions if r["hash"].startswith(ref)]
+        if not matches:
+            raise KeyError(f"Pod '{name}' has no revision matching '{ref}'")
+        if len({r["hash"] for r in matches}) > 1:
+            raise KeyError(f"Hash prefix '{ref}' is ambiguous for pod '{name}'")
+        return matches[-1]
+
+    def put(self, name, text, saved_at=None, note=None):
+        """Record text as the newest revision of a pod and return the head entry
+
+        Saving a config identical to the current head does not create a new
+        revision, so repeated save/validate/flash cycles stay cheap.
+        """
+        self.check_name(name)
+        # The object is written under the lock so a concurrent gc cannot
+        # delete it before the index refers to it
+        with self.transaction() as index:
+            config_hash = self.write_object(text)
+            pod = index["pods"].setdefault(name, {"revisions": [], "next_rev": 1})
+            head = pod["revisions"][-1] if pod["revisions"] else None
+            if head is not None and head["hash"] == config_hash:
+                return head
+
+            revision = self.new_revision(pod, config_hash, saved_at, note)
+            pod["revisions"].append(revision)
+            return revision
+
+    def new_revision(self, pod, config_hash, saved_at=None, note=None):
+        """Create a revision entry for pod, taking its next revision number"""
+        revision = {
+            "rev": pod["next_rev"],
+            "hash": config_hash,
+            "saved_at": saved_at or self.get_timestamp(),
+            "validated": None,
+            "validated_at": None,
+            "flash_started_at": None,
+            "flashed_at": None,
+        }
+        if note:
+            revision["note"] = note
+        pod["next_rev"] += 1
+        return revision
+
+    def get(self, name, ref=None):
+        """Return the config text of a pod revision (head by default)"""
+        return self.read_object(self.resolve(name, ref)["hash"])
+
+    def working_path(self, name):
+        """Return the path of a pod's working copy, used for ESPHome commands"""
+        self.check_name(name)
+        return os.path.join(self.working_dir, f"{name}.yaml")
+
+    def checkout(self, name, ref=None):
+        """Write a pod revision to its working copy and return the file path"""
+        text = self.get(name, ref)
+        path = self.working_path(name)
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                if f.read() == text:
+                    return path
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            f.write(text)
+        os.replace(temp_path, path)
+        return path
+
+    def mark(self, name, ref=None, validated=None, flash_started=False, flashed=False):
+        """Record a validation result and/or flash for a pod revision
+
+        flashed must only be set once a flash is known to have succeeded; the
+        flash pipeline and gc rely on it. Use flash_started when a flash was
+        launched but its outcome cannot be observed.
+        """
+        with self.transaction():
+            revision = self.resolve(name, ref)
+            if validated is not None:
+                revision["validated"] = bool(validated)
+                revision["validated_at"] = self.get_timestamp()
+            if flash_started:
+                revision["flash_started_at"] = self.get_timestamp()
+            if flashed:
+                revision["flashed_at"] = self.get_timestamp()
+            return revision
+
+    def diff(self, name, old_ref=-1, new_ref=None):
+        """Return a unified diff between two revisions of a pod"""
+        old = self.resolve(name, old_ref)
+        new = self.resolve(name, new_ref)
+        old_lines = self.read_object(old["hash"]).splitlines(keepends=True)
+        new_lines = self.read_object(new["hash"]).splitlines(keepends=True)
+        return ''.join(difflib.unified_diff(
+            old_lines, new_lines,
+            fromfile=f"{name}@{old['rev']}", tofile=f"{name}@{new['rev']}"))
+
+    def rollback(self, name, ref=-1):
+        """Make an older revision the head again and refresh the working copy
+
+        The rollback is recorded as a new revision so history is never rewritten.
+        """
+        with self.transaction():
+            target = self.resolve(name, ref)
+            revision = self.put(name, self.read_object(target["hash"]),
+                                note=f"rollback to rev {target['rev']}")
+            self.checkout(name)
+            return revision
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+    def gc(self, keep=10):
+        """Drop old revisions and delete objects no revision refers to
+
+        Per pod, the newest `keep` revisions are kept, along with the most
+        recently flashed and the most recently validated revision so a known
+        good config is always available for rollback. Returns a tuple of
+        (revisions removed, objects removed).
+        """
+        with self.transaction() as index:
+            return self.collect_garbage(index, keep)
+
+    def collect_garbage(self, index, keep):
+        revisions_removed = 0
+        for pod in index["pods"].values():
+            revisions = pod["revisions"]
+            pinned = set()
+            flashed = [r for r in revisions if r.get("flashed_at")]
+            validated = [r for r in revisions if r.get("validated")]
+            if flashed:
+                pinned.add(flashed[-1]["rev"])
+            if validated:
+                pinned.add(validated[-1]["rev"])
+            recent = revisions[-keep:] if keep > 0 else revisions[-1:]
+            pinned.update(r["rev"] for r in recent)
+            kept = [r for r in revisions if r["rev"] in pinned]
+            revisions_removed += len(revisions) - len(kept)
+            pod["revisions"] = kept
+
+        referenced = {r["hash"] for pod in index["pods"].values() for r in pod["revisions"]}
+        objects_removed = 0
+        for prefix in os.listdir(self.objects_dir):
+            prefix_dir = os.path.join(self.objects_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for filename in os.listdir(prefix_dir):
+                config_hash = filename.split('.', 1)[0]
+                if config_hash not in referenced:
+                    os.remove(os.path.join(prefix_dir, filename))
+                    objects_removed += 1
+            if not os.listdir(prefix_dir):
+                os.rmdir(prefix_dir)
+
+        return revisions_removed, objects_removed
+
+    def import_legacy_files(self, directory):
+        """Import old "{name}_{timestamp}.yaml" files into the store
+
+        Files are imported oldest first so the newest becomes each pod's head.
+        Importing is safe to repeat: files already imported, or whose config
+        is already one of the pod's revisions, are skipped, and a file older
+        than the pod's current head is added to its history without
+        replacing the head. The files themselves are left in place. Returns
+        the number imported.
+        """
+        legacy = []
+        for filename in os.listdir(directory):
+            match = LEGACY_FILE_PATTERN.match(filename)
+            if not match:
+                continue
+            try:
+                self.check_name(match.group('name'))
+            except ValueError as e:
+                print(f"Skipping {filename}: {e}")
+                continue
+            legacy.append((match.group('stamp'), match.group('name'), filename))
+
+        imported = 0
+        new_heads = set()
+        with self.transaction() as index:
+            for stamp, name, filename in sorted(legacy):
+                pod = index["pods"].setdefault(name, {"revisions": [], "next_rev": 1})
+                imported_files = pod.setdefault("imported_files", [])
+                if filename in imported_files:
+                    continue
+                imported_files.append(filename)
+
+                with open(os.path.join(directory, filename), 'r') as f:
+                    config_hash = self.write_object(f.read())
+                if any(r["hash"] == config_hash for r in pod["revisions"]):
+                    continue
+
+                saved_at = datetime.datetime.strptime(stamp, "%Y%m%d_%H%M%S").isoformat(timespec='seconds')
+                revision = self.new_revision(pod, config_hash, saved_at, note=f"imported from {filename}")
+                newer = [i for i, r in enumerate(pod["revisions"]) if r["saved_at"] > saved_at]
+                if newer:
+                    # Older than the current head: keep it as history only
+                    pod["revisions"].insert(newer[0], revision)
+                else:
+                    pod["revisions"].append(revision)
+                    new_heads.add(name)
+                imported += 1
+
+        for name in new_heads:
+            self.checkout(name)
+        return imported
+
+    @staticmethod
+    def get_timestamp():
+        """Generate an ISO timestamp for index entries"""
+        return datetime.datetime.now().isoformat(timespec='seconds')
+
+
+def format_revision(revision, is_head=False):
+    """Format a revision entry as a single line for the command line"""
+    if revision["validated"] is None:
+        validated = "unvalidated"
+    else:
+        validated = "valid" if revision["validated"] else "invalid"
+    if revision.get("flashed_at"):
+        flashed = f"flashed {revision['flashed_at']}"
+    elif revision.get("flash_started_at"):
+        flashed = f"flash started {revision['flash_started_at']}"
+    else:
+        flashed = "not flashed"
+    marker = "*" if is_head else " "
+    line = f"{marker} rev {revision['rev']:<4} {revision['hash'][:12]}  {revision['saved_at']}  {validated:<11}  {flashed}"
+    if revision.get("note"):
+        line += f"  ({revision['note']})"
+    return line
+
+
+def main(argv=None):
+    import argparse
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Inspect and maintain the pod configuration store")
+    parser.add_argument("--store", default=os.path.join(script_dir, "configs"),
+                        help="Store directory (default: %(default)s)")
+    parser.add_argument("--working-dir", default=script_dir,
+                        help="Directory for pod working copies (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list", help="List pods and their current revision")
+
+    log_parser = subparsers.add_parser("log", help="Show the revisions of a pod")
+    log_parser.add_argument("name")
+
+    show_parser = subparsers.add_parser("show", help="Print a revision of a pod")
+    show_parser.add_argument("name")
+    show_parser.add_argument("ref", nargs="?", default=None)
+
+    diff_parser = subparsers.add_parser("diff", help="Diff two revisions of a pod")
+    diff_parser.add_argument("name")
+    diff_parser.add_argument("old", nargs="?", default="-1")
+    diff_parser.add_argument("new", nargs="?", default=None)
+
+    rollback_parser = subparsers.add_parser("rollback", help="Restore an older revision of a pod")
+    rollback_parser.add_argument("name")
+    rollback_parser.add_argument("ref", nargs="?", default="-1")
+
+    gc_parser = subparsers.add_parser("gc", help="Remove old revisions and unreferenced objects")
+    gc_parser.add_argument("--keep", type=int, default=10, help="Revisions to keep per pod (default: %(default)s)")
+
+    import_parser = subparsers.add_parser("import", help="Import legacy timestamped YAML files")
+    import_parser.add_argument("directory", nargs="?", default=script_dir)
+
+    args = parser.parse_args(argv)
+    store = ConfigStore(args.store, working_dir=args.working_dir)
+
+    try:
+        if args.command == "list":
+            pods = store.read_index()["pods"]
+            for name in sorted(pods):
+                print(f"{name:<24} {format_revision(pods[name]['revisions'][-1], is_head=True)[2:]}")
+        elif args.command == "log":
+            revisions = store.revisions(args.name)
+            for revision in revisions:
+                print(format_revision(revision, is_head=revision is revisions[-1]))
+        elif args.command == "show":
+            sys.stdout.write(store.get(args.name, args.ref))
+        elif args.command == "diff":
+            sys.stdout.write(store.diff(args.name, args.old, args.new))
+        elif args.command == "rollback":
+            revision = store.rollback(args.name, args.ref)
+            print(f"{args.name} is now at rev {revision['rev']} ({revision['hash'][:12]})")
+        elif args.command == "gc":
+            revisions_removed, objects_removed = store.gc(keep=args.keep)
+            print(f"Removed {revisions_removed} revisions and {objects_removed} objects")
+        elif args.command == "import":
+            count = store.import_legacy_files(args.directory)
+            print(f"Imported {count} files from {args.directory}")
+    except (KeyError, ValueError, RuntimeError) as e:
+        print(f"Error: {e.args[0]}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,7 +10,9 @@ import subprocess
 import traceback
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import datetime
+from io import StringIO
+
+from config_store import ConfigStore
 
 # Add ruamel.yaml import for better YAML handling with comments
 try:
@@ -38,6 +40,9 @@ class ConfigToolApp:
         
         # Initialize variables
         self.config_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "example-config.yaml")
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        self.config_store = ConfigStore(os.path.join(script_dir, "configs"), working_dir=script_dir)
+        self.current_pod = None
         self.config_data = self.load_config()
         self.original_yaml_content = self.load_original_yaml()
         
@@ -184,12 +189,6 @@ class ConfigToolApp:
                 # For other files, use save_to_file instead
                 return self.save_to_file(self.config_file_path)
                 
-            # Backup the original file
-            backup_path = f"{self.config_file_path}.backup"
-            if os.path.exists(self.config_file_path):
-                with open(self.config_file_path, 'r') as src, open(backup_path, 'w') as dst:
-                    dst.write(src.read())
-            
             # Try to save with comment preservation using ruamel.yaml if available
             if 'YAML' in globals() and YAML is not None:
                 yaml_handler = YAML()
@@ -200,7 +199,6 @@ class ConfigToolApp:
                 if self.original_yaml_content:
                     # Try to update the parsed YAML with our modified values
                     try:
-                        from io import StringIO
                         original_yaml = yaml_handler.load(self.original_yaml_content)
                         
                         # Update the parsed YAML with our modified data
@@ -440,17 +438,12 @@ class ConfigToolApp:
             if not sensors_updated:
                 messagebox.showwarning("Warning", "Could not find BLE RSSI sensors in the configuration.")
             
-            # Create a timestamp-based filename for the new config
-            timestamp = f"{self.name_var.get()}_{self.get_timestamp()}"
-            new_config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{timestamp}.yaml")
-            
-            # Save to the new config file path
-            self.save_to_file(new_config_path)
-            
-            # Update the config file path to use this new file
-            self.config_file_path = new_config_path
+            # Record the config as a new revision of this pod in the config store
+            revision = self.save_to_store()
+            if revision is None:
+                return
             
-            self.status_var.set(f"Configuration saved to {os.path.basename(new_config_path)}")
+            self.status_var.set(f"Configuration saved as {self.current_pod} rev {revision['rev']} ({revision['hash'][:12]})")
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save configuration: {e}")
@@ -462,20 +455,13 @@ class ConfigToolApp:
             self.status_var.set("Validating configuration...")
             self.root.update()
             
-            # Check if we're already using a saved configuration file
-            # If not, save a new one for validation
-            if self.config_file_path.endswith("example-config.yaml"):
-                # Create a new configuration file for validation
-                timestamp = f"{self.name_var.get()}_{self.get_timestamp()}"
-                new_config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{timestamp}.yaml")
-                
-                # Save to the new file path
-                if not self.save_to_file(new_config_path):
+            # Check if we're already using a stored configuration
+            # If not, store one for validation
+            if self.current_pod is None:
+                revision = self.save_to_store()
+                if revision is None:
                     return
-                    
-                # Update the config file path
-                self.config_file_path = new_config_path
-                self.status_var.set(f"Created new configuration file: {os.path.basename(new_config_path)}")
+                self.status_var.set(f"Stored {self.current_pod} rev {revision['rev']} for validation")
             
             # Run ESPHome validation
             esphome_path = self.get_esphome_path()
@@ -503,6 +489,9 @@ class ConfigToolApp:
                 cwd=working_dir
             )
             
+            # Record the result against the revision that was validated
+            self.config_store.mark(self.current_pod, validated=(result.returncode == 0))
+            
             if result.returncode == 0:
                 messagebox.showinfo("Validation Successful", f"The configuration ({config_file}) is valid!")
                 self.status_var.set("Configuration validated successfully")
@@ -526,24 +515,12 @@ class ConfigToolApp:
     def flash_device(self):
         # Flash the firmware to the device
         try:
-            # Check if we're already using a saved configuration file
-            # If not, save a new one for flashing
-            if self.config_file_path.endswith("example-config.yaml"):
-                # Create a new configuration file for flashing
-                timestamp = f"{self.name_var.get()}_{self.get_timestamp()}"
-                new_config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{timestamp}.yaml")
-                
-                # Save to the new file path
-                if not self.save_to_file(new_config_path):
-                    return
-                    
-                # Update the config file path
-                self.config_file_path = new_config_path
-                self.status_var.set(f"Created new configuration file: {os.path.basename(new_config_path)}")
-            else:
-                # If we're using an existing file, just make sure it's up to date
-                if not self.save_to_file(self.config_file_path):
-                    return
+            # Make sure the stored configuration is up to date before flashing
+            # (unchanged configs are deduplicated, so this does not add a revision)
+            revision = self.save_to_store()
+            if revision is None:
+                return
+            self.status_var.set(f"Using {self.current_pod} rev {revision['rev']} for flashing")
                 
             # Ask user to confirm
             if not messagebox.askyesno("Confirm", f"This will flash the firmware to your ESP32 device using {os.path.basename(self.config_file_path)}. Continue?"):
@@ -604,6 +581,10 @@ class ConfigToolApp:
                 # Linux
                 subprocess.Popen(['x-terminal-emulator', '-e', f'cd "{working_dir}" && {cmd_prefix} run {config_file_path}'])
             
+            # The flash runs in an external terminal, so only the launch can be recorded
+            # here; the revision is not marked as flashed since the outcome is unknown
+            self.config_store.mark(self.current_pod, flash_started=True)
+            
             self.status_var.set(f"Flashing using {config_file_path}. Command started in terminal.")
             
         except FileNotFoundError as e:
@@ -616,10 +597,19 @@ class ConfigToolApp:
             self.status_var.set(f"Error: {e}")
             traceback.print_exc()  # Print exception details for debugging
 
-    def get_timestamp(self):
-        """Generate a timestamp string for filename"""
-        now = datetime.datetime.now()
-        return now.strftime("%Y%m%d_%H%M%S")
+    def dump_config_text(self):
+        """Serialize the configuration to YAML text"""
+        stream = StringIO()
+        # Try to dump with comment preservation using ruamel.yaml if available
+        if 'YAML' in globals() and YAML is not None:
+            yaml_handler = YAML()
+            yaml_handler.preserve_quotes = True
+            yaml_handler.indent(mapping=2, sequence=4, offset=2)
+            yaml_handler.dump(self.config_data, stream)
+        else:
+            # Fallback to standard YAML
+            yaml.dump(self.config_data, stream, default_flow_style=False, sort_keys=False)
+        return stream.getvalue()
         
     def save_to_file(self, file_path):
         """Save the configuration to the specified file path"""
@@ -629,29 +619,41 @@ class ConfigToolApp:
                 messagebox.showerror("Error", "Configuration data is empty!")
                 return False
                 
-            # Try to save with comment preservation using ruamel.yaml if available
-            if 'YAML' in globals() and YAML is not None:
-                yaml_handler = YAML()
-                yaml_handler.preserve_quotes = True
-                yaml_handler.indent(mapping=2, sequence=4, offset=2)
-                
-                with open(file_path, 'w') as file:
-                    yaml_handler.dump(self.config_data, file)
-                
-                print(f"Configuration saved to {file_path}")
-                return True
-            else:
-                # Fallback to standard YAML
-                with open(file_path, 'w') as file:
-                    yaml.dump(self.config_data, file, default_flow_style=False, sort_keys=False)
-                
-                print(f"Configuration saved to {file_path} (with standard YAML)")
-                return True
+            with open(file_path, 'w') as file:
+                file.write(self.dump_config_text())
+            
+            print(f"Configuration saved to {file_path}")
+            return True
                 
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save configuration to {file_path}: {e}")
             traceback.print_exc()
             return False
+            
+    def save_to_store(self):
+        """Save the configuration as a revision of the current pod in the config store
+
+        Returns the head revision entry, or None if saving failed. The pod's
+        working copy becomes the config file used for validating and flashing.
+        """
+        try:
+            # Safety check to prevent saving an empty config
+            if not self.config_data:
+                messagebox.showerror("Error", "Configuration data is empty!")
+                return None
+                
+            name = self.name_var.get()
+            revision = self.config_store.put(name, self.dump_config_text())
+            self.config_file_path = self.config_store.checkout(name)
+            self.current_pod = name
+            
+            print(f"Configuration stored as {name} rev {revision['rev']} ({revision['hash'][:12]})")
+            return revision
+                
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to store configuration: {e}")
+            traceback.print_exc()
+            return None
 
     def fix_all_widget_backgrounds(self):
         """Recursively set background color for all widgets"""
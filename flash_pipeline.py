@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+# First-flash pipeline for provisioning a tray of fresh ESP32 boards
+# Watches for newly attached serial ports, matches each one to the next
+# unflashed pod in the config store and flashes several boards in parallel.
+# Port discovery and flashing sit behind small interfaces so the scheduler
+# can run against pseudo-terminals and a fake flasher (see --simulate).
+import sys
+import os
+import re
+import glob
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from config_store import ConfigStore
+
+# Optional: pyserial gives accurate USB port listings on every platform
+try:
+    from serial.tools import list_ports
+except ImportError:
+    list_ports = None
+
+# Device name patterns used when pyserial is not installed
+SERIAL_PORT_GLOBS = [
+    '/dev/ttyUSB*',         # Linux, USB-UART bridges (CP210x, CH340)
+    '/dev/ttyACM*',         # Linux, native USB (ESP32-C3 USB_SERIAL_JTAG)
+    '/dev/cu.usbserial*',   # macOS, USB-UART bridges
+    '/dev/cu.usbmodem*',    # macOS, native USB
+    '/dev/cu.wchusbserial*',
+]
+
+# esptool progress lines look like "Writing at 0x00010000... (42 %)"
+PROGRESS_PATTERN = re.compile(r'\((\d{1,3})\s*%\)')
+
+# Native USB boards drop off the bus and come back when they reset after a
+# flash; ignore a port this many seconds after a successful flash on it
+PORT_COOLDOWN = 10
+
+# Upload/port failures are retried on another board at most this many times
+MAX_ATTEMPTS = 3
+
+
+# ----------------------------------------------------------------------
+# Port discovery
+# ----------------------------------------------------------------------
+class PortDiscovery:
+    """Interface for listing the serial ports currently attached"""
+
+    def list_ports(self):
+        """Return a set of port device paths"""
+        raise NotImplementedError
+
+
+class SerialPortDiscovery(PortDiscovery):
+    """Lists USB serial ports using pyserial, falling back to /dev globbing"""
+
+    def list_ports(self):
+        if list_ports is not None:
+            return {port.device for port in list_ports.comports() if port.vid is not None}
+        if sys.platform == 'win32':
+            raise RuntimeError("pyserial is required for port discovery on Windows (pip install pyserial)")
+        ports = set()
+        for pattern in SERIAL_PORT_GLOBS:
+            ports.update(glob.glob(pattern))
+        return ports
+
+
+class PortWatcher:
+    """Reports serial ports attached since the previous poll
+
+    Ports present when the watcher is created are treated as already known
+    (e.g. a debug probe), unless include_existing is set.
+    """
+
+    def __init__(self, discovery, include_existing=False):
+        self.discovery = discovery
+        self.known = set() if include_existing else discovery.list_ports()
+
+    def poll(self):
+        """Return newly attached ports in a stable order"""
+        current = self.discovery.list_ports()
+        # Forget ports that were unplugged so a re-attached board is seen again
+        self.known &= current
+        new_ports = sorted(current - self.known)
+        self.known.update(new_ports)
+        return new_ports
+
+
+# ----------------------------------------------------------------------
+# Flashing
+# ----------------------------------------------------------------------
+class PodFlashError(Exception):
+    """The pod's configuration cannot be flashed on any board (e.g. it does not compile)"""
+
+
+class Flasher:
+    """Interface for writing a pod configuration to the board on a port"""
+
+    def flash(self, port, config_path, progress):
+        """Flash config_path to the board on port
+
+        progress(percent, message) may be called from the worker thread; percent
+        is None for plain log lines. Returns True on success and False when the
+        board or port failed, so the pod may be retried on another board.
+        Raises PodFlashError when the configuration itself is at fault.
+        """
+        raise NotImplementedError
+
+
+class ESPHomeFlasher(Flasher):
+    """Compiles and uploads a config with the ESPHome CLI over a given port"""
+
+    def __init__(self, command=None):
+        if command is None:
+            esphome = shutil.which('esphome')
+            command = [esphome] if esphome else [sys.executable, '-m', 'esphome']
+        self.command = command
+        # ESPHome shares its PlatformIO cache between builds, so compile one
+        # config at a time and only run the uploads in parallel
+        self.compile_lock = threading.Lock()
+
+    def run(self, args, config_path, progress):
+        cmd = self.command + args
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(config_path))
+        )
+        for line in process.stdout:
+            line = line.rstrip()
+            match = PROGRESS_PATTERN.search(line)
+            progress(int(match.group(1)) if match else None, line)
+        return process.wait() == 0
+
+    def flash(self, port, config_path, progress):
+        config_file = os.path.basename(config_path)
+        progress(0, "Compiling firmware")
+        with self.compile_lock:
+            if not self.run(['compile', config_file], config_path, progress):
+                raise PodFlashError("ESPHome could not compile the configuration")
+        progress(0, f"Uploading to {port}")
+        return self.run(['upload', '--device', port, config_file], config_path, progress)
+
+
+# ----------------------------------------------------------------------
+# Scheduler
+# ----------------------------------------------------------------------
+class FlashScheduler:
+    """Assigns newly attached ports to pods and flashes them in parallel
+
+    All config store access happens on the calling thread; workers only run
+    the flasher. A pod whose upload fails goes back to the front of the
+    queue and is assigned to the next board that is plugged in, up to
+    max_attempts times. A pod whose configuration is at fault (PodFlashError)
+    is dropped straight away so it does not hold up the rest of the tray.
+    Dropped pods are listed in `failed` with the reason.
+
+    A port is only handed out while it is attached and idle: ports that are
+    already flashing, already waiting, or were flashed successfully less
+    than port_cooldown seconds ago are ignored when they (re)appear.
+    """
+
+    def __init__(self, store, inventory, discovery, flasher, max_workers=4,
+                 poll_interval=0.5, include_existing=False, on_progress=None, on_result=None,
+                 max_attempts=MAX_ATTEMPTS, port_cooldown=PORT_COOLDOWN):
+        self.store = store
+        self.queue = deque(inventory)
+        self.watcher = PortWatcher(discovery, include_existing=include_existing)
+        self.flasher = flasher
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.port_cooldown = port_cooldown
+        self.on_progress = on_progress or (lambda port, pod, percent, message: None)
+        self.on_result = on_result or (lambda port, pod, ok, retrying: None)
+        self.pending_ports = deque()
+        self.cooldown = {}
+        self.attempts = {}
+        self.failed = {}
+        self.results = []
+
+    def flash_one(self, port, pod, config_path):
+        """Run the flasher, returning (ok, error) where error marks a pod failure"""
+        def progress(percent, message):
+            self.on_progress(port, pod, percent, message)
+        try:
+            return self.flasher.flash(port, config_path, progress), None
+        except PodFlashError as e:
+            progress(None, f"Configuration error: {e}")
+            return False, str(e)
+        except Exception as e:
+            progress(None, f"Flash error: {e}")
+            return False, None
+
+    def collect_ports(self, running):
+        """Add newly attached, idle ports to pending_ports and drop detached ones"""
+        new_ports = self.watcher.poll()
+        attached = self.watcher.known
+        now = time.monotonic()
+        self.cooldown = {port: until for port, until in self.cooldown.items() if until > now}
+        busy = {port for port, _ in running.values()}
+        self.pending_ports = deque(port for port in self.pending_ports if port in attached)
+        for port in new_ports:
+            if port in busy or port in self.pending_ports or port in self.cooldown:
+                continue
+            self.pending_ports.append(port)
+
+    def finish(self, port, pod, ok, error):
+        """Record the outcome of one flash and requeue or drop the pod"""
+        retrying = False
+        if ok:
+            self.store.mark(pod, flashed=True)
+            self.cooldown[port] = time.monotonic() + self.port_cooldown
+        else:
+            self.attempts[pod] = self.attempts.get(pod, 0) + 1
+            if error is None and self.attempts[pod] >= self.max_attempts:
+                error = f"failed on {self.attempts[pod]} boards"
+            if error is None:
+                self.queue.appendleft(pod)
+                retrying = True
+            else:
+                self.failed[pod] = error
+        self.results.append((port, pod, ok))
+        self.on_result(port, pod, ok, retrying)
+
+    def run(self, timeout=None):
+        """Flash pods until the inventory is done or timeout seconds pass
+
+        Returns a list of (port, pod, ok) tuples in completion order.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                # After the deadline, let in-flight flashes finish but start nothing new
+                expired = deadline is not None and time.monotonic() >= deadline
+                if not running and (expired or not self.queue):
+                    break
+
+                self.collect_ports(running)
+
+                # Start a job for every waiting port while there are pods left
+                while not expired and self.pending_ports and self.queue and len(running) < self.max_workers:
+                    port = self.pending_ports.popleft()
+                    pod = self.queue.popleft()
+                    config_path = self.store.checkout(pod)
+                    self.on_progress(port, pod, 0, f"Assigned {pod}")
+                    future = executor.submit(self.flash_one, port, pod, config_path)
+                    running[future] = (port, pod)
+
+                if not running:
+                    time.sleep(self.poll_interval)
+                    continue
+
+                done, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    port, pod = running.pop(future)
+                    ok, error = future.result()
+                    self.finish(port, pod, ok, error)
+        return self.results
+
+
+def was_flashed(pod):
+    """Whether any revision of a pod index entry was flashed or had a flash launched"""
+    return any(r.get("flashed_at") or r.get("flash_started_at") for r in pod["revisions"])
+
+
+def unflashed_pods(store):
+    """Return pods that have never been flashed at any revision, in name order
+
+    A pod flashed at an older revision already has a board on the network;
+    giving a fresh board the same ESPHome name would clash with it. Flashes
+    launched from the configuration tool only record flash_started_at, since
+    their outcome is unknown, so those pods are left out as well; name them
+    explicitly to flash them anyway.
+    """
+    pods = store.read_index()["pods"]
+    return [name for name in sorted(pods) if not was_flashed(pods[name])]
+
+
+# ----------------------------------------------------------------------
+# Pseudo-terminal stand-ins
+# ----------------------------------------------------------------------
+class PtyBoard:
+    """A fake board on the far end of a pseudo-terminal
+
+    Reads length-prefixed blocks written to the port and acknowledges each
+    one with "OK", the way a serial bootloader would.
+    """
+
+    def __init__(self):
+        import pty
+        import tty
+        self.master_fd, self.slave_fd = pty.openpty()
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+        self.received = bytearray()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def read_exact(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = os.read(self.master_fd, size - len(data))
+            if not chunk:
+                raise EOFError
+            data.extend(chunk)
+        return bytes(data)
+
+    def serve(self):
+        try:
+            while True:
+                size = int.from_bytes(self.read_exact(4), 'big')
+                self.received.extend(self.read_exact(size))
+                os.write(self.master_fd, b"OK\n")
+        except (OSError, EOFError):
+            pass
+
+    def close(self):
+        # The slave end stays open until now so reads on the master do not
+        # fail with EIO while no flasher has the port open
+        os.close(self.slave_fd)
+        os.close(self.master_fd)
+
+
+class PtyPortDiscovery(PortDiscovery):
+    """Port discovery backed by pseudo-terminals that can be attached at will"""
+
+    def __init__(self):
+        self.boards = {}
+        self.lock = threading.Lock()
+
+    def attach(self):
+        """Plug in a new fake board and return its port path"""
+        board = PtyBoard()
+        with self.lock:
+            self.boards[board.port] = board
+        return board.port
+
+    def detach(self, port):
+        with self.lock:
+            board = self.boards.pop(port)
+        board.close()
+
+    def list_ports(self):
+        with self.lock:
+            return set(self.boards)
+
+
+class FakeFlasher(Flasher):
+    """Streams the config over the port in blocks, waiting for an ack per block"""
+
+    def __init__(self, block_size=512, block_delay=0.0):
+        self.block_size = block_size
+        self.block_delay = block_delay
+
+    def flash(self, port, config_path, progress):
+        with open(config_path, 'rb') as f:
+            image = f.read()
+        fd = os.open(port, os.O_RDWR | os.O_NOCTTY)
+        try:
+            with os.fdopen(fd, 'r+b', buffering=0) as serial_port:
+                for offset in range(0, len(image), self.block_size):
+                    block = image[offset:offset + self.block_size]
+                    serial_port.write(len(block).to_bytes(4, 'big') + block)
+                    if serial_port.read(3) != b"OK\n":
+                        progress(None, f"No acknowledgement at offset {offset}")
+                        return False
+                    written = offset + len(block)
+                    progress(written * 100 // len(image), f"Writing at 0x{offset:08x}")
+                    time.sleep(self.block_delay)
+        except OSError as e:
+            progress(None, f"Serial error: {e}")
+            return False
+        return True
+
+
+# ----------------------------------------------------------------------
+# Command line
+# ----------------------------------------------------------------------
+def main(argv=None):
+    import argparse
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(
+        description="Flash fresh boards as they are plugged in, one pod per board")
+    parser.add_argument("pods", nargs="*",
+                        help="Pods to provision, in order (default: every pod not yet flashed)")
+    parser.add_argument("--store", default=os.path.join(script_dir, "configs"),
+                        help="Config store directory (default: %(default)s)")
+    parser.add_argument("--working-dir", default=script_dir,
+                        help="Directory for pod working copies (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=4, help="Boards to flash in parallel (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=None, help="Stop waiting for new boards after this many seconds")
+    parser.add_argument("--include-existing", action="store_true",
+                        help="Also flash boards that are already attached at start")
+    parser.add_argument("--simulate", type=int, metavar="N", default=0,
+                        help="Use N pseudo-terminal boards and a fake flasher instead of real hardware")
+    args = parser.parse_args(argv)
+
+    store = ConfigStore(args.store, working_dir=args.working_dir)
+    inventory = args.pods or unflashed_pods(store)
+    if not args.pods:
+        pods = store.read_index()["pods"]
+        started = [name for name in sorted(pods)
+                   if not any(r.get("flashed_at") for r in pods[name]["revisions"]) and was_flashed(pods[name])]
+        if started:
+            print(f"Skipping pods flashed from the configuration tool: {', '.join(started)} "
+                  "(name them explicitly to flash them again)")
+    missing = [pod for pod in inventory if store.head(pod) is None]
+    if missing:
+        print(f"Error: no stored configuration for: {', '.join(missing)}", file=sys.stderr)
+        return 1
+    if not inventory:
+        print("Nothing to flash: every pod in the store has been flashed")
+        return 0
+
+    if args.simulate:
+        # Simulated flashes must never be recorded in the real store, so run
+        # against a throwaway copy of it
+        with tempfile.TemporaryDirectory() as temp_dir:
+            copy_dir = os.path.join(temp_dir, "configs")
+            shutil.copytree(store.store_dir, copy_dir, ignore=shutil.ignore_patterns("index.lock"))
+            simulated_store = ConfigStore(copy_dir, working_dir=temp_dir)
+            print(f"Simulating {args.simulate} boards against a temporary copy of the config store")
+            return run_pipeline(args, simulated_store, inventory,
+                                PtyPortDiscovery(), FakeFlasher(block_delay=0.01))
+    return run_pipeline(args, store, inventory, SerialPortDiscovery(), ESPHomeFlasher())
+
+
+def run_pipeline(args, store, inventory, discovery, flasher):
+    """Run the scheduler for the command line, printing progress per port"""
+    print_lock = threading.Lock()
+    last_percent = {}
+
+    def on_progress(port, pod, percent, message):
+        # Only print every 10% step per port to keep interleaved output readable
+        if percent is not None:
+            step = percent // 10
+            if last_percent.get(port) == step and percent not in (0, 100):
+                return
+            last_percent[port] = step
+        label = "" if percent is None else f"{percent:3d}%  "
+        with print_lock:
+            print(f"[{port}] {pod}: {label}{message}")
+
+    def on_result(port, pod, ok, retrying):
+        last_percent.pop(port, None)
+        if ok:
+            outcome = "flashed"
+        elif retrying:
+            outcome = "FAILED, will retry on the next board"
+        else:
+            outcome = f"FAILED ({scheduler.failed[pod]}), giving up on this pod"
+        with print_lock:
+            print(f"[{port}] {pod}: {outcome}")
+
+    try:
+        scheduler = FlashScheduler(store, inventory, discovery, flasher, max_workers=args.workers,
+                                   include_existing=args.include_existing,
+                                   on_progress=on_progress, on_result=on_result)
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Waiting for boards to flash {len(inventory)} pods: {', '.join(inventory)}")
+    if args.simulate:
+        # Plug the simulated tray in after the watcher has taken its baseline
+        def plug_in():
+            for _ in range(args.simulate):
+                time.sleep(0.1)
+                discovery.attach()
+        threading.Thread(target=plug_in, daemon=True).start()
+
+    try:
+        results = scheduler.run(timeout=args.timeout)
+    except KeyboardInterrupt:
+        print("Interrupted")
+        return 1
+
+    flashed = [pod for _, pod, ok in results if ok]
+    remaining = list(scheduler.queue)
+    summary = f"Flashed {len(flashed)} pods"
+    if scheduler.failed:
+        summary += f", {len(scheduler.failed)} failed: {', '.join(scheduler.failed)}"
+    if remaining:
+        summary += f", {len(remaining)} left: {', '.join(remaining)}"
+    print(summary)
+    return 0 if not remaining and not scheduler.failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
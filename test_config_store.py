@@ -0,0 +1,143 @@
+# Tests for the deduplicated, indexed pod configuration store
+import os
+
+import pytest
+
+import config_store
+from config_store import ConfigStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ConfigStore(tmp_path / "configs", working_dir=tmp_path)
+
+
+def object_files(store):
+    return {name for _, _, files in os.walk(store.objects_dir) for name in files}
+
+
+def test_put_deduplicates_head_and_objects(store):
+    first = store.put("pod", "a: 1\n")
+    assert store.put("pod", "a: 1\n") == first
+    store.put("pod", "a: 2\n")
+    store.put("other", "a: 1\n")
+
+    assert [r["rev"] for r in store.revisions("pod")] == [1, 2]
+    assert len(object_files(store)) == 2
+    assert store.get("pod") == "a: 2\n"
+
+
+def test_put_rejects_invalid_and_reserved_names(store, tmp_path):
+    for name in ("../escape", "sub/pod", "Pod1", "", "example-config"):
+        with pytest.raises(ValueError):
+            store.put(name, "a: 1\n")
+    assert store.pods() == []
+    assert not os.path.exists(tmp_path / "escape.yaml")
+
+
+def test_resolve_numbers_offsets_and_hash_prefixes(store):
+    for value in range(1, 4):
+        store.put("pod", f"a: {value}\n")
+    revisions = store.revisions("pod")
+
+    assert store.resolve("pod")["rev"] == 3
+    assert store.resolve("pod", 2)["rev"] == 2
+    assert store.resolve("pod", "1")["rev"] == 1
+    assert store.resolve("pod", -1)["rev"] == 2
+    assert store.resolve("pod", "-2")["rev"] == 1
+    assert store.resolve("pod", revisions[0]["hash"][:8])["rev"] == 1
+    for ref in (5, -3, "beef" * 3):
+        with pytest.raises(KeyError):
+            store.resolve("pod", ref)
+
+
+def test_resolve_all_digit_hash_prefix(store):
+    # Find a config whose hash starts with digits only, as a real prefix can
+    text = next(t for t in (f"a: {i}\n" for i in range(1000)) if ConfigStore.hash_text(t)[:7].isdigit())
+    store.put("pod", text)
+
+    assert store.resolve("pod", ConfigStore.hash_text(text)[:7])["hash"] == ConfigStore.hash_text(text)
+
+
+def test_diff_between_revisions(store):
+    store.put("pod", "a: 1\nb: 1\n")
+    store.put("pod", "a: 1\nb: 2\n")
+
+    diff = store.diff("pod")
+    assert "--- pod@1" in diff and "+++ pod@2" in diff
+    assert "-b: 1" in diff and "+b: 2" in diff
+
+
+def test_rollback_records_new_revision_and_checks_out(store):
+    store.put("pod", "a: 1\n")
+    store.put("pod", "a: 2\n")
+
+    revision = store.rollback("pod", 1)
+
+    assert revision["rev"] == 3
+    assert [r["hash"] for r in store.revisions("pod")][0] == revision["hash"]
+    with open(store.working_path("pod")) as f:
+        assert f.read() == "a: 1\n"
+
+
+def test_gc_keeps_flashed_and_validated_and_removes_objects(store):
+    for value in range(1, 7):
+        store.put("pod", f"a: {value}\n")
+        if value == 2:
+            store.mark("pod", flashed=True)
+        if value == 3:
+            store.mark("pod", validated=True)
+
+    revisions_removed, objects_removed = store.gc(keep=2)
+
+    assert [r["rev"] for r in store.revisions("pod")] == [2, 3, 5, 6]
+    assert (revisions_removed, objects_removed) == (2, 2)
+    assert len(object_files(store)) == 4
+    assert store.get("pod", 2) == "a: 2\n"
+
+
+def test_changes_from_other_store_instances_are_kept(store):
+    other = ConfigStore(store.store_dir, working_dir=store.working_dir)
+    store.put("a", "a: 1\n")
+    store.mark("a", flashed=True)
+
+    other.put("b", "b: 1\n")
+
+    assert store.head("a")["flashed_at"]
+    assert store.pods() == ["a", "b"]
+
+
+def test_lock_times_out_while_held(store, monkeypatch):
+    monkeypatch.setattr(config_store, "LOCK_TIMEOUT", 0.1)
+    other = ConfigStore(store.store_dir, working_dir=store.working_dir)
+
+    with store.transaction():
+        with pytest.raises(RuntimeError):
+            other.put("b", "b: 1\n")
+    other.put("b", "b: 1\n")
+    assert store.pods() == ["b"]
+
+
+def test_import_legacy_files_is_repeatable(store, tmp_path):
+    legacy_dir = tmp_path / "legacy"
+    legacy_dir.mkdir()
+    (legacy_dir / "mmwave-pod1_20250101_120000.yaml").write_text("v: 1\n")
+    (legacy_dir / "mmwave-pod1_20250102_120000.yaml").write_text("v: 2\n")
+    (legacy_dir / "Bad Name_20250102_120000.yaml").write_text("v: 2\n")
+
+    assert store.import_legacy_files(legacy_dir) == 2
+    assert store.get("mmwave-pod1") == "v: 2\n"
+
+    store.put("mmwave-pod1", "v: 3\n")
+    store.checkout("mmwave-pod1")
+    (legacy_dir / "mmwave-pod1_20250103_120000.yaml").write_text("v: 2.5\n")
+
+    assert store.import_legacy_files(legacy_dir) == 1
+    assert [store.read_object(r["hash"]) for r in store.revisions("mmwave-pod1")] == \
+        ["v: 1\n", "v: 2\n", "v: 2.5\n", "v: 3\n"]
+    assert store.get("mmwave-pod1") == "v: 3\n"
+    with open(store.working_path("mmwave-pod1")) as f:
+        assert f.read() == "v: 3\n"
+
+    assert store.import_legacy_files(legacy_dir) == 0
+    assert len(store.revisions("mmwave-pod1")) == 4
@@ -0,0 +1,245 @@
+# Tests for the first-flash scheduler using pseudo-terminal boards
+import sys
+import time
+import threading
+
+import pytest
+
+import flash_pipeline
+from config_store import ConfigStore
+from flash_pipeline import (FakeFlasher, Flasher, FlashScheduler, PodFlashError, PortDiscovery,
+                            PortWatcher, PtyPortDiscovery, unflashed_pods)
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason="pseudo-terminals need a POSIX system")
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ConfigStore(tmp_path / "configs", working_dir=tmp_path)
+    for name in ("pod-a", "pod-b"):
+        store.put(name, f"substitutions:\n  name: {name}\n" + "# padding\n" * 200)
+    return store
+
+
+@pytest.fixture
+def discovery():
+    discovery = PtyPortDiscovery()
+    yield discovery
+    for port in list(discovery.boards):
+        discovery.detach(port)
+
+
+def plug_in(discovery, count, delay=0.05):
+    """Attach boards from a background thread, after the watcher's baseline"""
+    def attach():
+        for _ in range(count):
+            time.sleep(delay)
+            discovery.attach()
+    thread = threading.Thread(target=attach, daemon=True)
+    thread.start()
+    return thread
+
+
+class FailFirstFlasher(FakeFlasher):
+    """Fails the first flash without touching the port, then behaves normally"""
+
+    def __init__(self):
+        super().__init__(block_size=256)
+        self.failed = False
+
+    def flash(self, port, config_path, progress):
+        if not self.failed:
+            self.failed = True
+            return False
+        return super().flash(port, config_path, progress)
+
+
+class UnplugFirstFlasher(FakeFlasher):
+    """Unplugs the first board halfway through its flash"""
+
+    def __init__(self, discovery):
+        super().__init__(block_size=256)
+        self.discovery = discovery
+        self.unplugged = None
+
+    def flash(self, port, config_path, progress):
+        def unplug_midway(percent, message):
+            if self.unplugged is None and percent is not None and percent >= 50:
+                self.unplugged = port
+                self.discovery.detach(port)
+            progress(percent, message)
+        return super().flash(port, config_path, unplug_midway)
+
+
+class SlowFlasher(FakeFlasher):
+    def flash(self, port, config_path, progress):
+        time.sleep(0.5)
+        return super().flash(port, config_path, progress)
+
+
+class StaticDiscovery(PortDiscovery):
+    def __init__(self, ports=()):
+        self.ports = set(ports)
+
+    def list_ports(self):
+        return set(self.ports)
+
+
+class ResettingFlasher(Flasher):
+    """Mimics a native USB board that drops off the bus mid-flash and after it"""
+
+    def __init__(self, discovery):
+        self.discovery = discovery
+        self.flashes = []
+
+    def reconnect(self, port):
+        self.discovery.ports.discard(port)
+        time.sleep(0.15)
+        self.discovery.ports.add(port)
+        time.sleep(0.15)
+
+    def flash(self, port, config_path, progress):
+        self.flashes.append(port)
+        self.reconnect(port)
+        threading.Thread(target=self.reconnect, args=(port,), daemon=True).start()
+        return True
+
+
+class BrokenPodFlasher(FakeFlasher):
+    """Raises PodFlashError for pod-a, or fails every upload of it"""
+
+    def __init__(self, pod_error=True):
+        super().__init__(block_size=256)
+        self.pod_error = pod_error
+
+    def flash(self, port, config_path, progress):
+        if config_path.endswith("pod-a.yaml"):
+            if self.pod_error:
+                raise PodFlashError("does not compile")
+            return False
+        return super().flash(port, config_path, progress)
+
+
+def test_failed_pod_is_retried_on_next_board(store, discovery):
+    scheduler = FlashScheduler(store, ["pod-a", "pod-b"], discovery, FailFirstFlasher(), poll_interval=0.05)
+    plug_in(discovery, 3)
+
+    results = scheduler.run(timeout=10)
+
+    assert [(pod, ok) for _, pod, ok in results].count(("pod-a", False)) == 1
+    assert {pod for _, pod, ok in results if ok} == {"pod-a", "pod-b"}
+    # The failed board is not reused; each attempt gets its own port
+    assert len({port for port, _, _ in results}) == 3
+    assert store.head("pod-a")["flashed_at"] and store.head("pod-b")["flashed_at"]
+
+
+def test_config_error_drops_pod_without_retrying(store, discovery):
+    scheduler = FlashScheduler(store, ["pod-a", "pod-b"], discovery, BrokenPodFlasher(), poll_interval=0.05)
+    plug_in(discovery, 3)
+
+    results = scheduler.run(timeout=10)
+
+    assert [(pod, ok) for _, pod, ok in results] == [("pod-a", False), ("pod-b", True)]
+    assert scheduler.failed == {"pod-a": "does not compile"}
+    assert list(scheduler.queue) == []
+
+
+def test_upload_failures_stop_after_max_attempts(store, discovery):
+    scheduler = FlashScheduler(store, ["pod-a", "pod-b"], discovery, BrokenPodFlasher(pod_error=False),
+                               poll_interval=0.05, max_attempts=2)
+    plug_in(discovery, 4)
+
+    results = scheduler.run(timeout=10)
+
+    assert [(pod, ok) for _, pod, ok in results] == [("pod-a", False), ("pod-a", False), ("pod-b", True)]
+    assert "pod-a" in scheduler.failed
+    assert unflashed_pods(store) == ["pod-a"]
+
+
+def test_reconnecting_board_gets_only_one_pod(store):
+    discovery = StaticDiscovery()
+    flasher = ResettingFlasher(discovery)
+    scheduler = FlashScheduler(store, ["pod-a", "pod-b"], discovery, flasher, poll_interval=0.05)
+    discovery.ports.add("/dev/ttyACM0")
+
+    results = scheduler.run(timeout=1)
+
+    assert flasher.flashes == ["/dev/ttyACM0"]
+    assert results == [("/dev/ttyACM0", "pod-a", True)]
+    assert list(scheduler.queue) == ["pod-b"]
+
+
+def test_board_unplugged_during_flash(store, discovery):
+    flasher = UnplugFirstFlasher(discovery)
+    scheduler = FlashScheduler(store, ["pod-a"], discovery, flasher, poll_interval=0.05)
+    plug_in(discovery, 2, delay=0.3)
+
+    results = scheduler.run(timeout=10)
+
+    # The replacement board may get the same device name as the unplugged one
+    assert results[0] == (flasher.unplugged, "pod-a", False)
+    assert [(pod, ok) for _, pod, ok in results[1:]] == [("pod-a", True)]
+
+
+def test_timeout_without_boards_leaves_inventory(store, discovery):
+    scheduler = FlashScheduler(store, ["pod-a", "pod-b"], discovery, FakeFlasher(), poll_interval=0.05)
+
+    start = time.monotonic()
+    assert scheduler.run(timeout=0.3) == []
+    assert time.monotonic() - start < 2
+    assert list(scheduler.queue) == ["pod-a", "pod-b"]
+    assert unflashed_pods(store) == ["pod-a", "pod-b"]
+
+
+def test_deadline_finishes_running_flash_but_starts_no_new_one(store, discovery):
+    scheduler = FlashScheduler(store, ["pod-a", "pod-b"], discovery, SlowFlasher(),
+                               max_workers=1, poll_interval=0.05)
+    plug_in(discovery, 2, delay=0.01).join()
+
+    results = scheduler.run(timeout=0.2)
+
+    assert [(pod, ok) for _, pod, ok in results] == [("pod-a", True)]
+    assert list(scheduler.queue) == ["pod-b"]
+
+
+def test_watcher_reports_reattached_port():
+    discovery = StaticDiscovery({"/dev/ttyUSB0"})
+    watcher = PortWatcher(discovery)
+    assert watcher.poll() == []
+
+    discovery.ports.add("/dev/ttyUSB1")
+    assert watcher.poll() == ["/dev/ttyUSB1"]
+    assert watcher.poll() == []
+
+    discovery.ports.discard("/dev/ttyUSB1")
+    assert watcher.poll() == []
+    discovery.ports.add("/dev/ttyUSB1")
+    assert watcher.poll() == ["/dev/ttyUSB1"]
+
+
+def test_unflashed_pods_skips_flashed_and_flash_started_pods(store):
+    store.mark("pod-a", flashed=True)
+    store.put("pod-a", "substitutions:\n  name: pod-a\n  edited: true\n")
+    store.mark("pod-b", flash_started=True)
+    store.put("pod-b", "substitutions:\n  name: pod-b\n  edited: true\n")
+    store.put("pod-c", "substitutions:\n  name: pod-c\n")
+
+    assert unflashed_pods(store) == ["pod-c"]
+
+
+def test_simulate_does_not_write_flash_status(store):
+    result = flash_pipeline.main(["--store", store.store_dir, "--working-dir", store.working_dir,
+                                  "--simulate", "2", "--timeout", "10"])
+
+    assert result == 0
+    assert unflashed_pods(store) == ["pod-a", "pod-b"]
+
+
+def test_missing_pyserial_on_windows_is_reported(store, monkeypatch, capsys):
+    monkeypatch.setattr(flash_pipeline, "list_ports", None)
+    monkeypatch.setattr(flash_pipeline.sys, "platform", "win32")
+
+    result = flash_pipeline.main(["--store", store.store_dir, "--working-dir", store.working_dir])
+
+    assert result == 1
+    assert "Error: pyserial is required" in capsys.readouterr().err